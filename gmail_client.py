@@ -3,36 +3,109 @@ Gmail Client for fetching and analyzing email data.
 Handles Gmail API integration with privacy-first design.
 """
 
-import base64
-import email
 import re
+import threading
+import time
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import List, Dict, Any, Optional, Tuple
 from datetime import datetime, timedelta
 from email.mime.text import MIMEText
+from email.utils import parsedate_to_datetime
+import httplib2
+import pybase64
 from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
+from google_auth_httplib2 import AuthorizedHttp
 from google.oauth2.credentials import Credentials
-from colorama import Fore, Style, init
+from terminal_colors import Fore, Style
 import html2text
-from bs4 import BeautifulSoup
+from selectolax.parser import HTMLParser
+from tqdm import tqdm
 
-# Initialize colorama
-init(autoreset=True)
+# Matches the address in "Name <email@domain.com>" sender headers
+_ANGLE_ADDR_RE = re.compile(r'<([^>]+)>')
+
+# Matches the charset parameter of a Content-Type header
+_CHARSET_RE = re.compile(r'charset="?([^";\s]+)', re.IGNORECASE)
+
+# Message headers kept on parsed emails
+_WANTED_HEADERS = frozenset({
+    'from', 'to', 'cc', 'bcc', 'reply-to', 'subject', 'date', 'message-id'
+})
+
+# Normalized format for parsed email dates
+_DATE_FMT = '%Y-%m-%d %H:%M:%S'
 
 class GmailClient:
     """Gmail API client for secure email data fetching and analysis."""
     
+    # Calls per batch request; Gmail accepts up to 100, but rate-limits
+    # batches larger than 50
+    BATCH_SIZE = 50
+    
+    # Throttled or failed sub-requests are retried with exponential backoff
+    RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+    RETRY_REASONS = frozenset({'rateLimitExceeded', 'userRateLimitExceeded'})
+    MAX_RETRIES = 4
+    RETRY_BACKOFF_SECONDS = 1.0
+    
+    # Concurrent batch requests in flight (kept low: every batch call
+    # counts against the per-user quota)
+    MAX_WORKERS = 4
+    
+    # Socket timeout in seconds (googleapiclient's own default when it builds the transport)
+    HTTP_TIMEOUT = 60
+    
+    # Headers requested when only message metadata is needed
+    METADATA_HEADERS = ['From', 'To', 'Subject', 'Date']
+    
+    # Response projections: only the fields _parse_message reads. Full
+    # messages cover MIME trees up to three levels of nested parts.
+    METADATA_FIELDS = 'id,threadId,snippet,labelIds,payload/headers'
+    FULL_FIELDS = (
+        'id,threadId,snippet,labelIds,'
+        'payload(mimeType,headers,body/data,'
+        'parts(mimeType,headers,body/data,'
+        'parts(mimeType,headers,body/data,'
+        'parts(mimeType,headers,body/data))))'
+    )
+    
+    # MIME types never rendered as body text
+    BINARY_MIME_PREFIXES = ('image/', 'application/', 'audio/', 'video/')
+    
+    # HTML elements whose contents are never body text
+    NON_TEXT_TAGS = ['script', 'style', 'noscript']
+    
+    # Maximum parsed messages kept in the in-memory cache
+    CACHE_MAX = 2048
+    
+    # Search results (message IDs) are reused for this many seconds
+    LIST_CACHE_TTL = 60
+    LIST_CACHE_MAX = 64
+    
     def __init__(self, credentials: Credentials):
         """Initialize Gmail client with authenticated credentials."""
         self.credentials = credentials
         self.service = None
         self.user_email = None
+        self._local = threading.local()
+        self._msg_cache: OrderedDict = OrderedDict()
+        self._list_cache: OrderedDict = OrderedDict()
+        self._cache_lock = threading.Lock()
+        # Long-lived so worker threads keep their keep-alive transports between searches
+        self._executor = ThreadPoolExecutor(max_workers=self.MAX_WORKERS,
+                                            thread_name_prefix='gmail-batch')
         self._connect()
     
     def _connect(self):
         """Establish connection to Gmail API."""
         try:
             print(f"{Fore.CYAN}📧 Connecting to Gmail API...{Style.RESET_ALL}")
-            self.service = build('gmail', 'v1', credentials=self.credentials)
+            # One keep-alive transport shared by all calls on this thread
+            http = AuthorizedHttp(self.credentials, http=self._new_http())
+            self._local.http = http
+            self.service = build('gmail', 'v1', http=http)
             
             # Get user profile to verify connection
             profile = self.service.users().getProfile(userId='me').execute()
@@ -46,7 +119,8 @@ class GmailClient:
             raise
     
     def search_emails(self, query: str = "", max_results: int = 100, 
-                     date_range: Optional[Tuple[str, str]] = None) -> List[Dict[str, Any]]:
+                     date_range: Optional[Tuple[str, str]] = None,
+                     fetch_format: str = 'full', quiet: bool = False) -> List[Dict[str, Any]]:
         """
         Search emails with optional query and date range.
         
@@ -54,12 +128,16 @@ class GmailClient:
             query: Gmail search query (e.g., "from:friend@example.com")
             max_results: Maximum number of emails to fetch
             date_range: Tuple of (start_date, end_date) in YYYY/MM/DD format
+            fetch_format: 'full' to include bodies, 'metadata' for headers and snippet only
+            quiet: Suppress progress output (for fetches running behind a prompt);
+                   warnings and errors are still printed
             
         Returns:
             List of email dictionaries with metadata and content
         """
         try:
-            print(f"{Fore.CYAN}🔍 Searching emails...{Style.RESET_ALL}")
+            if not quiet:
+                print(f"{Fore.CYAN}🔍 Searching emails...{Style.RESET_ALL}")
             
             # Build search query
             search_query = query
@@ -70,68 +148,247 @@ class GmailClient:
                 if end_date:
                     search_query += f" before:{end_date}"
             
-            print(f"{Fore.YELLOW}📋 Query: {search_query or 'All emails'}{Style.RESET_ALL}")
+            if not quiet:
+                print(f"{Fore.YELLOW}📋 Query: {search_query or 'All emails'}{Style.RESET_ALL}")
             
             # Search for message IDs
-            results = self.service.users().messages().list(
-                userId='me',
-                q=search_query,
-                maxResults=max_results
-            ).execute()
-            
-            messages = results.get('messages', [])
-            print(f"{Fore.GREEN}📧 Found {len(messages)} emails{Style.RESET_ALL}")
+            message_ids = self._list_message_ids(search_query, max_results)
+            if not quiet:
+                print(f"{Fore.GREEN}📧 Found {len(message_ids)} emails{Style.RESET_ALL}")
             
-            if not messages:
+            if not message_ids:
                 return []
             
-            # Fetch full email data
-            emails = []
-            for i, message in enumerate(messages):
-                try:
-                    print(f"{Fore.CYAN}📥 Fetching email {i+1}/{len(messages)}...{Style.RESET_ALL}", end='\r')
-                    email_data = self._get_email_details(message['id'])
-                    if email_data:
-                        emails.append(email_data)
-                except Exception as e:
-                    print(f"{Fore.YELLOW}⚠️  Skipped email {i+1}: {str(e)}{Style.RESET_ALL}")
-                    continue
+            # Fetch email data in batches (one HTTP round trip per chunk)
+            emails = self._batch_get_emails(message_ids, fetch_format=fetch_format, quiet=quiet)
             
-            print(f"{Fore.GREEN}✅ Successfully fetched {len(emails)} emails{Style.RESET_ALL}")
+            if not quiet:
+                print(f"{Fore.GREEN}✅ Successfully fetched {len(emails)} emails{Style.RESET_ALL}")
             return emails
             
         except Exception as e:
             print(f"{Fore.RED}❌ Email search failed: {str(e)}{Style.RESET_ALL}")
             return []
     
-    def _get_email_details(self, message_id: str) -> Optional[Dict[str, Any]]:
-        """Fetch detailed email data for a specific message ID."""
-        try:
-            message = self.service.users().messages().get(
-                userId='me', 
-                id=message_id,
-                format='full'
-            ).execute()
+    def _list_message_ids(self, search_query: str, max_results: int) -> List[str]:
+        """List message IDs for a query, reusing results younger than LIST_CACHE_TTL."""
+        key = (search_query, max_results)
+        now = time.monotonic()
+        with self._cache_lock:
+            cached = self._list_cache.get(key)
+            if cached is not None and now - cached[0] < self.LIST_CACHE_TTL:
+                return cached[1]
+        
+        # Searches may run on background threads, so use this thread's transport
+        results = self.service.users().messages().list(
+            userId='me',
+            q=search_query,
+            maxResults=max_results
+        ).execute(http=self._thread_http())
+        message_ids = [message['id'] for message in results.get('messages', [])]
+        
+        with self._cache_lock:
+            self._list_cache[key] = (now, message_ids)
+            self._list_cache.move_to_end(key)
+            while len(self._list_cache) > self.LIST_CACHE_MAX:
+                self._list_cache.popitem(last=False)
+        
+        return message_ids
+    
+    def _batch_get_emails(self, message_ids: List[str], fetch_format: str = 'full',
+                          quiet: bool = False) -> List[Dict[str, Any]]:
+        """
+        Fetch and parse messages using Gmail batch requests.
+        
+        Cached messages are served from memory; the remaining ones are fetched
+        in batches of BATCH_SIZE, executed concurrently on the client's
+        thread pool (a single batch runs on the calling thread). Calls that
+        were rate-limited or hit a server error are retried up to
+        MAX_RETRIES times. Results are returned in the order of message_ids.
+        """
+        results: Dict[str, Dict[str, Any]] = {}
+        missing = []
+        for message_id in message_ids:
+            email_data = self._cache_get(message_id, fetch_format)
+            if email_data is not None:
+                results[message_id] = email_data
+            else:
+                missing.append(message_id)
+        
+        if not missing:
+            return [results[message_id] for message_id in message_ids]
+        
+        pending = missing
+        with tqdm(total=len(message_ids), initial=len(results),
+                  desc='📥 Fetching emails', unit='email', leave=False,
+                  disable=quiet) as progress:
+            for attempt in range(self.MAX_RETRIES + 1):
+                if attempt:
+                    # Back off exponentially before retrying throttled calls
+                    time.sleep(self.RETRY_BACKOFF_SECONDS * 2 ** (attempt - 1))
+                failures = self._fetch_batches(pending, fetch_format, results, progress)
+                pending = list(failures)
+                if not pending:
+                    break
             
-            # Extract headers
-            headers = {}
-            for header in message['payload'].get('headers', []):
-                headers[header['name'].lower()] = header['value']
+            for message_id, exception in failures.items():
+                progress.write(f"{Fore.YELLOW}⚠️  Skipped email {message_id} after {self.MAX_RETRIES} retries: {str(exception)}{Style.RESET_ALL}")
+        
+        return [results[message_id] for message_id in message_ids if message_id in results]
+    
+    def _fetch_batches(self, message_ids: List[str], fetch_format: str,
+                       results: Dict[str, Dict[str, Any]], progress: tqdm) -> Dict[str, Exception]:
+        """
+        Run one round of batch requests, storing parsed messages in results.
+        
+        Returns the retryable failures (rate limits, server errors) by message ID.
+        """
+        chunks = [
+            message_ids[start:start + self.BATCH_SIZE]
+            for start in range(0, len(message_ids), self.BATCH_SIZE)
+        ]
+        lock = threading.Lock()
+        failures: Dict[str, Exception] = {}
+        
+        def _on_response(request_id, response, exception):
+            if exception is not None:
+                if self._is_retryable(exception):
+                    with lock:
+                        failures[request_id] = exception
+                    return
+                progress.write(f"{Fore.YELLOW}⚠️  Skipped email {request_id}: {str(exception)}{Style.RESET_ALL}")
+                return
+            email_data = self._parse_message(response, fetch_format=fetch_format)
+            if email_data:
+                self._cache_put(request_id, fetch_format, email_data)
+                with lock:
+                    results[request_id] = email_data
+        
+        def _execute_chunk(chunk: List[str]) -> int:
+            batch = self.service.new_batch_http_request(callback=_on_response)
+            for message_id in chunk:
+                batch.add(
+                    self._message_request(message_id, fetch_format),
+                    request_id=message_id
+                )
+            try:
+                # httplib2.Http is not thread-safe, so each thread uses its own
+                batch.execute(http=self._thread_http())
+            except Exception as e:
+                if self._is_retryable(e):
+                    with lock:
+                        failures.update(dict.fromkeys(chunk, e))
+                else:
+                    progress.write(f"{Fore.YELLOW}⚠️  Batch fetch failed: {str(e)}{Style.RESET_ALL}")
+                return 0
+            with lock:
+                return sum(1 for message_id in chunk if message_id not in failures)
+        
+        if len(chunks) == 1:
+            # A single batch runs on the calling thread's transport
+            progress.update(_execute_chunk(chunks[0]))
+        else:
+            futures = [self._executor.submit(_execute_chunk, chunk) for chunk in chunks]
+            for future in as_completed(futures):
+                progress.update(future.result())
+        
+        return failures
+    
+    def _is_retryable(self, exception: Exception) -> bool:
+        """Check whether a failed call was throttled or hit a transient server or network error."""
+        # Timeouts, connection resets, DNS and TLS failures on the batch POST
+        if isinstance(exception, (OSError, httplib2.HttpLib2Error)):
+            return True
+        
+        if not isinstance(exception, HttpError):
+            return False
+        
+        status = exception.resp.status
+        if status in self.RETRY_STATUSES:
+            return True
+        
+        # Gmail reports per-user rate limits as 403 with a rate-limit reason
+        return status == 403 and any(
+            isinstance(detail, dict) and detail.get('reason') in self.RETRY_REASONS
+            for detail in exception.error_details or ()
+        )
+    
+    def _cache_get(self, message_id: str, fetch_format: str) -> Optional[Dict[str, Any]]:
+        """Look up a parsed message; a cached full message also satisfies metadata."""
+        with self._cache_lock:
+            for key in ((message_id, fetch_format), (message_id, 'full')):
+                email_data = self._msg_cache.get(key)
+                if email_data is not None:
+                    self._msg_cache.move_to_end(key)
+                    return email_data
+        return None
+    
+    def _cache_put(self, message_id: str, fetch_format: str, email_data: Dict[str, Any]):
+        """Store a parsed message, evicting the least recently used entries."""
+        key = (message_id, fetch_format)
+        with self._cache_lock:
+            self._msg_cache[key] = email_data
+            self._msg_cache.move_to_end(key)
+            while len(self._msg_cache) > self.CACHE_MAX:
+                self._msg_cache.popitem(last=False)
+    
+    def _thread_http(self) -> AuthorizedHttp:
+        """Get an authorized HTTP transport owned by the current thread."""
+        http = getattr(self._local, 'http', None)
+        if http is None:
+            http = AuthorizedHttp(self.credentials, http=self._new_http())
+            self._local.http = http
+        return http
+    
+    def _new_http(self) -> httplib2.Http:
+        """Create a raw HTTP transport with the client's socket timeout."""
+        return httplib2.Http(cache=None, timeout=self.HTTP_TIMEOUT)
+    
+    def _message_request(self, message_id: str, fetch_format: str = 'full'):
+        """Build a messages.get request for the given fetch format."""
+        if fetch_format == 'metadata':
+            return self.service.users().messages().get(
+                userId='me',
+                id=message_id,
+                format='metadata',
+                metadataHeaders=self.METADATA_HEADERS,
+                fields=self.METADATA_FIELDS
+            )
+        
+        return self.service.users().messages().get(
+            userId='me',
+            id=message_id,
+            format='full',
+            fields=self.FULL_FIELDS
+        )
+    
+    def _parse_message(self, message: Dict[str, Any],
+                       fetch_format: str = 'full') -> Optional[Dict[str, Any]]:
+        """Parse a Gmail API message resource into an email dictionary."""
+        try:
+            # Extract headers, skipping Received:/DKIM-Signature: and other noise
+            headers = {
+                name: header['value']
+                for header in message['payload'].get('headers', ())
+                for name in (header['name'].lower(),)
+                if name in _WANTED_HEADERS
+            }
             
-            # Extract email content
-            body = self._extract_email_body(message['payload'])
+            # Extract email content (metadata responses carry no body)
+            body = ''
+            if fetch_format != 'metadata':
+                body = self._extract_email_body(message['payload'])
             
             # Parse date
             date_str = headers.get('date', '')
             try:
                 # Parse email date (RFC 2822 format)
-                parsed_date = email.utils.parsedate_to_datetime(date_str)
-                formatted_date = parsed_date.strftime('%Y-%m-%d %H:%M:%S')
-            except:
+                formatted_date = parsedate_to_datetime(date_str).strftime(_DATE_FMT)
+            except (TypeError, ValueError):
                 formatted_date = date_str
             
             return {
-                'id': message_id,
+                'id': message.get('id'),
                 'thread_id': message.get('threadId'),
                 'subject': headers.get('subject', 'No Subject'),
                 'from': headers.get('from', 'Unknown Sender'),
@@ -145,41 +402,79 @@ class GmailClient:
             }
             
         except Exception as e:
-            print(f"{Fore.YELLOW}⚠️  Failed to fetch email details: {str(e)}{Style.RESET_ALL}")
+            # Runs inside batch callbacks; tqdm.write keeps an active progress bar intact
+            tqdm.write(f"{Fore.YELLOW}⚠️  Failed to parse email: {str(e)}{Style.RESET_ALL}")
             return None
     
     def _extract_email_body(self, payload: Dict[str, Any]) -> str:
         """Extract readable text from email payload."""
-        body = ""
+        fragments = []
         
-        try:
+        # Walk the MIME tree iteratively, preserving part order
+        pending = [payload]
+        while pending:
+            part = pending.pop()
+            
             # Handle multipart emails
-            if 'parts' in payload:
-                for part in payload['parts']:
-                    body += self._extract_email_body(part)
-            else:
-                # Single part email
-                if payload.get('body', {}).get('data'):
-                    data = payload['body']['data']
-                    # Decode base64
-                    decoded = base64.urlsafe_b64decode(data).decode('utf-8', errors='ignore')
-                    
-                    # Handle HTML content
-                    mime_type = payload.get('mimeType', '')
-                    if 'html' in mime_type:
-                        # Convert HTML to text
-                        soup = BeautifulSoup(decoded, 'html.parser')
-                        body += soup.get_text(separator=' ', strip=True)
+            if 'parts' in part:
+                pending.extend(reversed(part['parts']))
+                continue
+            
+            # Skip attachments and other binary parts without decoding them
+            mime_type = part.get('mimeType', '')
+            if mime_type.startswith(self.BINARY_MIME_PREFIXES):
+                continue
+            
+            data = part.get('body', {}).get('data')
+            if not data:
+                continue
+            
+            # A part that fails to decode is skipped; text from the others is kept
+            try:
+                # Decode base64 (SIMD-accelerated; restore padding Gmail may omit)
+                raw = pybase64.urlsafe_b64decode(data + '=' * (-len(data) % 4))
+                
+                # Handle HTML content
+                if 'html' in mime_type:
+                    # Convert HTML to text. UTF-8 or undeclared bytes go to the parser,
+                    # which also honours <meta charset>; other charsets from the
+                    # Content-Type header are decoded here first
+                    charset = self._part_charset(part)
+                    if charset is None or charset.lower() in ('utf-8', 'utf8'):
+                        tree = HTMLParser(raw)
                     else:
-                        body += decoded
-                        
-        except Exception as e:
-            print(f"{Fore.YELLOW}⚠️  Failed to extract email body: {str(e)}{Style.RESET_ALL}")
-            return ""
+                        tree = HTMLParser(self._decode_text(raw, part))
+                    # Drop CSS/JS, which .text() would otherwise keep
+                    tree.strip_tags(self.NON_TEXT_TAGS)
+                    fragments.append(tree.text(separator=' ', strip=True))
+                else:
+                    fragments.append(self._decode_text(raw, part))
+                    
+            except Exception as e:
+                tqdm.write(f"{Fore.YELLOW}⚠️  Failed to extract email body part: {str(e)}{Style.RESET_ALL}")
+                continue
         
-        return body.strip()
+        return ' '.join(fragments).strip()
+    
+    def _part_charset(self, part: Dict[str, Any]) -> Optional[str]:
+        """Get the charset declared in a part's Content-Type header, if any."""
+        for header in part.get('headers', []):
+            if header['name'].lower() == 'content-type':
+                charset_match = _CHARSET_RE.search(header['value'])
+                return charset_match.group(1) if charset_match else None
+        return None
+    
+    def _decode_text(self, raw: bytes, part: Dict[str, Any]) -> str:
+        """Decode a text part using the charset from its Content-Type header."""
+        charset = self._part_charset(part) or 'utf-8'
+        
+        try:
+            return raw.decode(charset, errors='replace')
+        except LookupError:
+            return raw.decode('utf-8', errors='replace')
     
-    def get_recent_emails(self, days: int = 30, max_results: int = 50) -> List[Dict[str, Any]]:
+    def get_recent_emails(self, days: int = 30, max_results: int = 50,
+                          fetch_format: str = 'full', quiet: bool = False) -> List[Dict[str, Any]]:
         """Get recent emails from the last N days."""
         end_date = datetime.now()
         start_date = end_date - timedelta(days=days)
@@ -192,28 +487,44 @@ class GmailClient:
         return self.search_emails(
             query="",
             max_results=max_results,
-            date_range=date_range
+            date_range=date_range,
+            fetch_format=fetch_format,
+            quiet=quiet
         )
     
     def search_by_sender(self, sender: str, max_results: int = 50) -> List[Dict[str, Any]]:
         """Search emails from a specific sender."""
         return self.search_emails(
             query=f"from:{sender}",
-            max_results=max_results
+            max_results=max_results,
+            fetch_format='metadata'
         )
     
     def search_by_subject(self, subject_keywords: str, max_results: int = 50) -> List[Dict[str, Any]]:
         """Search emails by subject keywords."""
         return self.search_emails(
             query=f"subject:{subject_keywords}",
-            max_results=max_results
+            max_results=max_results,
+            fetch_format='metadata'
         )
     
     def search_by_content(self, content_keywords: str, max_results: int = 50) -> List[Dict[str, Any]]:
         """Search emails by content keywords."""
         return self.search_emails(
             query=content_keywords,
-            max_results=max_results
+            max_results=max_results,
+            fetch_format='full'
+        )
+    
+    def fetch_full_emails(self, emails: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Upgrade metadata-only emails to full messages including bodies."""
+        if not emails:
+            return []
+        
+        print(f"{Fore.CYAN}📥 Fetching full content for {len(emails)} emails...{Style.RESET_ALL}")
+        return self._batch_get_emails(
+            [email_data['id'] for email_data in emails],
+            fetch_format='full'
         )
     
     def get_email_statistics(self, emails: List[Dict[str, Any]]) -> Dict[str, Any]:
@@ -222,23 +533,23 @@ class GmailClient:
             return {}
         
         # Count by sender
-        senders = {}
+        senders = Counter()
         subjects = []
         dates = []
         
         for email_data in emails:
             sender = email_data.get('from', 'Unknown')
             # Extract email address from "Name <email@domain.com>" format
-            sender_match = re.search(r'<(.+?)>', sender)
+            sender_match = _ANGLE_ADDR_RE.search(sender)
             if sender_match:
                 sender = sender_match.group(1)
             
-            senders[sender] = senders.get(sender, 0) + 1
+            senders[sender] += 1
             subjects.append(email_data.get('subject', ''))
             dates.append(email_data.get('date', ''))
         
         # Top senders
-        top_senders = sorted(senders.items(), key=lambda x: x[1], reverse=True)[:10]
+        top_senders = senders.most_common(10)
         
         return {
             'total_emails': len(emails),
@@ -250,9 +561,18 @@ class GmailClient:
             }
         }
     
+    def clear_cache(self):
+        """Drop cached search results and messages so the next search hits Gmail."""
+        with self._cache_lock:
+            self._msg_cache.clear()
+            self._list_cache.clear()
+    
     def cleanup(self):
         """Clean up Gmail client resources."""
         print(f"{Fore.YELLOW}🧹 Cleaning up Gmail client...{Style.RESET_ALL}")
+        self._executor.shutdown(wait=False, cancel_futures=True)
         self.service = None
         self.credentials = None
+        self._local = threading.local()
+        self.clear_cache()
         print(f"{Fore.GREEN}✅ Gmail client cleaned up{Style.RESET_ALL}")
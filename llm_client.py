@@ -4,15 +4,14 @@ Supports multiple LLM providers with privacy-first design.
 """
 
 import os
-import json
-from typing import List, Dict, Any, Optional
-from openai import OpenAI
-from colorama import Fore, Style, init
+import asyncio
+from typing import List, Dict, Any, Optional, Callable
+import orjson
+import tiktoken
+from openai import OpenAI, AsyncOpenAI
+from terminal_colors import Fore, Style
 import getpass
 
-# Initialize colorama
-init(autoreset=True)
-
 class LLMClient:
     """LLM client for analyzing email data and generating insights."""
     
@@ -21,6 +20,13 @@ class LLMClient:
         self.client: Optional[OpenAI] = None
         self.api_key = None
         self.model = "gpt-3.5-turbo"  # More efficient model with better rate limits
+        self.email_token_budget = 4000  # Prompt tokens available for email data
+        self._encoding = None
+        self._encoding_model = None
+        # Streamed analyses share one event loop so the async client's
+        # pooled connections survive between questions
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._async_client: Optional[AsyncOpenAI] = None
         
     def authenticate(self, provider: str = "openai") -> bool:
         """
@@ -101,19 +107,10 @@ class LLMClient:
         try:
             print(f"{Fore.CYAN}🤖 Analyzing emails with LLM...{Style.RESET_ALL}")
             
-            # Prepare email data for LLM
-            email_summary = self._prepare_email_data(emails)
-            
-            # Create analysis prompt
-            prompt = self._create_analysis_prompt(email_summary, query)
-            
             # Send to LLM
             response = self.client.chat.completions.create(
                 model=self.model,
-                messages=[
-                    {"role": "system", "content": self._get_system_prompt()},
-                    {"role": "user", "content": prompt}
-                ],
+                messages=self._build_messages(emails, query),
                 max_tokens=1000,  # Reduced to prevent rate limits
                 temperature=0.7
             )
@@ -129,26 +126,141 @@ class LLMClient:
             print(f"{Fore.RED}❌ LLM analysis failed: {str(e)}{Style.RESET_ALL}")
             return f"❌ Analysis failed: {str(e)}"
     
+    def stream_analysis(self, emails: List[Dict[str, Any]], query: str,
+                        on_delta: Optional[Callable[[str], None]] = None) -> str:
+        """
+        Run analyze_emails_async to completion on the client's event loop.
+        
+        Args:
+            emails: List of email dictionaries
+            query: User's natural language query
+            on_delta: Optional callback invoked with each streamed text fragment
+            
+        Returns:
+            LLM analysis response
+        """
+        if self._loop is None:
+            self._loop = asyncio.new_event_loop()
+        return self._loop.run_until_complete(self.analyze_emails_async(emails, query, on_delta))
+    
+    async def analyze_emails_async(self, emails: List[Dict[str, Any]], query: str,
+                                   on_delta: Optional[Callable[[str], None]] = None) -> str:
+        """
+        Analyze email data with a streamed, non-blocking LLM request.
+        Must run on the client's event loop (see stream_analysis), which owns
+        the pooled async connections.
+        
+        Args:
+            emails: List of email dictionaries
+            query: User's natural language query
+            on_delta: Optional callback invoked with each streamed text fragment
+            
+        Returns:
+            LLM analysis response
+        """
+        if not self.is_authenticated():
+            return "❌ LLM client not authenticated. Please authenticate first."
+        
+        if not emails:
+            return "❌ No email data provided for analysis."
+        
+        try:
+            # Prompt building is CPU-bound; keep it off the event loop
+            messages = await asyncio.to_thread(self._build_messages, emails, query)
+            
+            if self._async_client is None:
+                self._async_client = AsyncOpenAI(api_key=self.api_key)
+            
+            stream = await self._async_client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                max_tokens=1000,  # Reduced to prevent rate limits
+                temperature=0.7,
+                stream=True
+            )
+            
+            fragments = []
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    fragments.append(delta)
+                    if on_delta:
+                        on_delta(delta)
+            
+            if not fragments:
+                return "❌ No response from LLM"
+            return ''.join(fragments)
+            
+        except Exception as e:
+            # Not printed here: it would land mid-line in the streamed output
+            return f"❌ Analysis failed: {str(e)}"
+    
+    def _build_messages(self, emails: List[Dict[str, Any]], query: str) -> List[Dict[str, str]]:
+        """Build the chat messages for an analysis request."""
+        # Prepare email data for LLM
+        email_summary = self._prepare_email_data(emails)
+        
+        # Create analysis prompt
+        prompt = self._create_analysis_prompt(email_summary, query)
+        
+        return [
+            {"role": "system", "content": self._get_system_prompt()},
+            {"role": "user", "content": prompt}
+        ]
+    
     def _prepare_email_data(self, emails: List[Dict[str, Any]]) -> str:
-        """Prepare email data for LLM analysis with aggressive token management."""
+        """Prepare email data for LLM analysis, packing emails up to the token budget."""
+        encoding = self._get_encoding()
         email_summaries = []
+        used_tokens = 2  # Enclosing brackets
         
-        # Limit to 20 emails for better token management
-        for i, email in enumerate(emails[:20]):
+        for i, msg in enumerate(emails):
             summary = {
                 "id": i + 1,
-                "date": email.get('date', 'Unknown')[:10],  # Just date, no time
-                "from": email.get('from', 'Unknown')[:50],  # Limit sender length
-                "subject": email.get('subject', 'No Subject')[:80],  # Limit subject
-                "snippet": email.get('snippet', '')[:100]  # Shorter snippet
+                "date": msg.get('date', 'Unknown')[:10],  # Just date, no time
+                "from": msg.get('from', 'Unknown')[:50],  # Limit sender length
+                "subject": msg.get('subject', 'No Subject')[:80],  # Limit subject
+                "snippet": msg.get('snippet', '')[:100]  # Shorter snippet
             }
             # Only include body preview if snippet is short
-            if len(email.get('snippet', '')) < 50:
-                summary["body_preview"] = email.get('body', '')[:150]
+            if len(msg.get('snippet', '')) < 50:
+                summary["body_preview"] = msg.get('body', '')[:150]
+            
+            # Serialize once; count the entry plus its list separator
+            serialized = orjson.dumps(summary).decode()
+            if encoding is not None:
+                cost = len(encoding.encode(serialized)) + 1
+            else:
+                # Roughly four characters per token for English JSON text
+                cost = len(serialized) // 4 + 2
+            if used_tokens + cost > self.email_token_budget:
+                break
             
-            email_summaries.append(summary)
+            email_summaries.append(serialized)
+            used_tokens += cost
         
-        return json.dumps(email_summaries, indent=1)
+        return '[' + ','.join(email_summaries) + ']'
+    
+    def _get_encoding(self):
+        """
+        Get the tiktoken encoding for the current model.
+        Returns None when the encoding cannot be loaded; callers then estimate.
+        """
+        if self._encoding_model != self.model:
+            try:
+                try:
+                    self._encoding = tiktoken.encoding_for_model(self.model)
+                except KeyError:
+                    self._encoding = tiktoken.get_encoding("cl100k_base")
+            except Exception as e:
+                # tiktoken downloads its BPE files from openaipublic.blob.core.windows.net
+                # on first use (cached afterwards, see TIKTOKEN_CACHE_DIR)
+                print(f"{Fore.YELLOW}⚠️  Tokenizer unavailable, estimating token counts: {str(e)}{Style.RESET_ALL}")
+                self._encoding = None
+            self._encoding_model = self.model
+        return self._encoding
     
     def _create_analysis_prompt(self, email_data: str, user_query: str) -> str:
         """Create analysis prompt for LLM."""
@@ -215,6 +327,12 @@ Always prioritize accuracy and usefulness in your responses."""
         if self.api_key:
             self.api_key = None
         self.client = None
+        if self._loop is not None:
+            if self._async_client is not None:
+                self._loop.run_until_complete(self._async_client.close())
+            self._loop.close()
+        self._async_client = None
+        self._loop = None
         print(f"{Fore.GREEN}✅ LLM client cleaned up{Style.RESET_ALL}")
     
     def is_authenticated(self) -> bool:
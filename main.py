@@ -5,15 +5,12 @@ Main application entry point with secure credential handling.
 
 import sys
 import atexit
-from colorama import Fore, Style, init
+from terminal_colors import Fore, Style, input_prompt
 from oauth_manager import OAuthManager
 from gmail_client import GmailClient
 from llm_client import LLMClient
 from query_interface import QueryInterface
 
-# Initialize colorama for cross-platform colored output
-init(autoreset=True)
-
 class GmailWithLLM:
     """Main application class for GmailWithLLM."""
     
@@ -79,7 +76,7 @@ class GmailWithLLM:
         print(f"   • {Fore.WHITE}No credentials will be saved to disk{Style.RESET_ALL}")
         print(f"   • {Fore.WHITE}All data is processed locally and securely{Style.RESET_ALL}")
         
-        input(f"\n{Fore.CYAN}Press Enter to continue...{Style.RESET_ALL}")
+        input(input_prompt(f"\n{Fore.CYAN}Press Enter to continue...{Style.RESET_ALL}"))
     
     def _authenticate_gmail(self) -> bool:
         """Authenticate with Gmail using OAuth2."""
@@ -4,16 +4,15 @@ Handles runtime-only credential collection with zero persistence.
 """
 
 import os
-import json
-import pickle
+import stat
+import threading
+import time
+from pathlib import Path
+from datetime import datetime, timezone
 from typing import Optional, Dict, Any
-from google.auth.transport.requests import Request
+import orjson
 from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from colorama import Fore, Style, init
-
-# Initialize colorama for cross-platform colored output
-init(autoreset=True)
+from terminal_colors import Fore, Style
 
 class OAuthManager:
     """Manages secure OAuth2 authentication for Gmail API access."""
@@ -23,10 +22,27 @@ class OAuthManager:
         'https://www.googleapis.com/auth/gmail.readonly'
     ]
     
+    # Background refresh fires at least this many seconds before expiry
+    REFRESH_MARGIN_SECONDS = 300
+    
+    # Failed background refreshes are retried with exponential backoff
+    REFRESH_RETRY_SECONDS = 15
+    REFRESH_RETRY_MAX_SECONDS = 600
+    
     def __init__(self):
         """Initialize OAuth manager with security-first defaults."""
         self.credentials: Optional[Credentials] = None
         self.credentials_file = 'credentials.json'
+        self.callback_port = 0  # OAuth redirect port; 0 lets the OS assign one in a single bind
+        self.early_refresh_percent = 0.9  # Refresh after this fraction of the remaining token lifetime
+        self._refresh_timer: Optional[threading.Timer] = None
+        self._refresh_lock = threading.Lock()
+        self._refresh_failures = 0
+        self._transport = None  # Created on first refresh
+        self._valid_until_ts: float = 0.0  # Epoch seconds until which credentials count as valid
+        self._valid_until_expiry: Optional[datetime] = None  # Expiry _valid_until_ts was computed from
+        self._client_config_cache: Optional[Dict[str, Any]] = None
+        self._client_config_mtime: Optional[int] = None
         
     def authenticate(self) -> Credentials:
         """
@@ -36,8 +52,20 @@ class OAuthManager:
         print(f"{Fore.CYAN}🔐 Gmail OAuth2 Authentication{Style.RESET_ALL}")
         print(f"{Fore.YELLOW}⚠️  This will open your browser for Gmail authentication{Style.RESET_ALL}")
         
-        # Check if credentials file exists
-        if not os.path.exists(self.credentials_file):
+        # Check that the credentials file exists and is a regular file (one stat,
+        # reused below for the config cache)
+        try:
+            file_stat = os.stat(self.credentials_file)
+        except OSError:
+            file_stat = None
+        
+        if file_stat is not None and not stat.S_ISREG(file_stat.st_mode):
+            # e.g. a directory left behind where the downloaded file should be
+            print(f"{Fore.RED}❌ Error: {self.credentials_file} is not a regular file{Style.RESET_ALL}")
+            print(f"{Fore.YELLOW}📋 Replace it with the OAuth2 credentials.json downloaded from Google Cloud Console{Style.RESET_ALL}")
+            raise OSError(f"Gmail API credentials file '{self.credentials_file}' is not a regular file")
+        
+        if file_stat is None:
             print(f"{Fore.RED}❌ Error: {self.credentials_file} not found{Style.RESET_ALL}")
             print(f"{Fore.YELLOW}📋 Please follow these steps:{Style.RESET_ALL}")
             print("   1. Go to https://console.cloud.google.com/")
@@ -47,10 +75,12 @@ class OAuthManager:
             print("   5. Download credentials.json to this directory")
             raise FileNotFoundError(f"Gmail API credentials file '{self.credentials_file}' not found")
         
+        # Deferred: pulls in requests/oauthlib, only needed for the browser flow
+        from google_auth_oauthlib.flow import InstalledAppFlow
+        
         try:
             # Load credentials from file
-            with open(self.credentials_file, 'r') as f:
-                client_config = json.load(f)
+            client_config = self._load_client_config(file_stat.st_mtime_ns)
             
             print(f"{Fore.GREEN}✅ Found credentials file{Style.RESET_ALL}")
             print(f"{Fore.CYAN}🌐 Opening browser for authentication...{Style.RESET_ALL}")
@@ -67,7 +97,7 @@ class OAuthManager:
             # Run local server for OAuth callback
             # This will open browser and handle the OAuth flow
             credentials = flow.run_local_server(
-                port=0,  # Use random available port
+                port=self.callback_port,
                 prompt='consent',  # Always show consent screen for fresh auth
                 access_type='offline',  # Request offline access
                 authorization_prompt_message='Please visit this URL to authorize the application: {url}',
@@ -75,53 +105,147 @@ class OAuthManager:
                 open_browser=True
             )
             
-            if credentials and credentials.valid:
-                self.credentials = credentials
-                print(f"{Fore.GREEN}✅ Gmail authentication successful!{Style.RESET_ALL}")
-                print(f"{Fore.CYAN}📧 Connected to Gmail account{Style.RESET_ALL}")
-                return credentials
-            else:
-                raise Exception("Authentication failed - invalid credentials")
+            # run_local_server raises on failure and returns freshly issued credentials
+            self.credentials = credentials
+            self._update_valid_until()
+            self._schedule_refresh()
+            print(f"{Fore.GREEN}✅ Gmail authentication successful!{Style.RESET_ALL}")
+            print(f"{Fore.CYAN}📧 Connected to Gmail account{Style.RESET_ALL}")
+            return credentials
                 
         except Exception as e:
             print(f"{Fore.RED}❌ Authentication failed: {str(e)}{Style.RESET_ALL}")
             raise
     
+    def _load_client_config(self, mtime: int) -> Dict[str, Any]:
+        """Load the OAuth client config, re-parsing only when the file's mtime changes."""
+        if self._client_config_cache is None or mtime != self._client_config_mtime:
+            self._client_config_cache = orjson.loads(Path(self.credentials_file).read_bytes())
+            self._client_config_mtime = mtime
+        return self._client_config_cache
+    
     def get_credentials(self) -> Optional[Credentials]:
         """Get current valid credentials."""
         return self.credentials
     
     def is_authenticated(self) -> bool:
         """Check if we have valid credentials."""
-        return self.credentials is not None and self.credentials.valid
+        if self.credentials is None:
+            return False
+        # AuthorizedHttp refreshes tokens without going through this manager
+        if self.credentials.expiry != self._valid_until_expiry:
+            self._update_valid_until()
+        return time.time() < self._valid_until_ts
     
     def refresh_credentials(self) -> bool:
         """
         Refresh expired credentials if possible.
+        On-demand refresh for callers outside the Gmail client (whose
+        AuthorizedHttp transports refresh expired tokens themselves).
         Returns True if refresh successful, False otherwise.
         """
         if not self.credentials:
             return False
             
         try:
-            if self.credentials.expired and self.credentials.refresh_token:
-                print(f"{Fore.YELLOW}🔄 Refreshing expired credentials...{Style.RESET_ALL}")
-                self.credentials.refresh(Request())
-                print(f"{Fore.GREEN}✅ Credentials refreshed successfully{Style.RESET_ALL}")
-                return True
-            return self.credentials.valid
+            with self._refresh_lock:
+                if self.credentials.expired and self.credentials.refresh_token:
+                    print(f"{Fore.YELLOW}🔄 Refreshing expired credentials...{Style.RESET_ALL}")
+                    self.credentials.refresh(self._get_transport())
+                    self._update_valid_until()
+                    print(f"{Fore.GREEN}✅ Credentials refreshed successfully{Style.RESET_ALL}")
+                    refreshed = True
+                else:
+                    # Expiry may have moved if the token was refreshed elsewhere
+                    self._update_valid_until()
+                    return self.credentials.valid
+            self._schedule_refresh()
+            return refreshed
         except Exception as e:
             print(f"{Fore.RED}❌ Failed to refresh credentials: {str(e)}{Style.RESET_ALL}")
             return False
     
+    def _get_transport(self):
+        """Get the pooled HTTP transport reused by every token refresh."""
+        if self._transport is None:
+            # Deferred: requests is only needed once a refresh happens
+            import requests
+            from google.auth.transport.requests import Request
+            self._transport = Request(session=requests.Session())
+        return self._transport
+    
+    def _update_valid_until(self):
+        """Cache the credential expiry as an epoch timestamp with a 30s margin."""
+        self._valid_until_expiry = self.credentials.expiry
+        if self.credentials.expiry is None:
+            self._valid_until_ts = float('inf')
+        else:
+            # google-auth stores expiry as a naive UTC datetime
+            expiry = self.credentials.expiry.replace(tzinfo=timezone.utc)
+            self._valid_until_ts = expiry.timestamp() - 30
+    
+    def _schedule_refresh(self):
+        """Schedule a background token refresh ahead of credential expiry."""
+        self._cancel_refresh()
+        
+        if not self.credentials or not self.credentials.expiry or not self.credentials.refresh_token:
+            return
+        
+        # google-auth stores expiry as a naive UTC datetime
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        remaining = (self.credentials.expiry - now).total_seconds()
+        delay = max(0.0, min(remaining * self.early_refresh_percent,
+                             remaining - self.REFRESH_MARGIN_SECONDS))
+        self._start_refresh_timer(delay)
+    
+    def _start_refresh_timer(self, delay: float):
+        """Start the daemon timer that runs the next background refresh."""
+        self._refresh_timer = threading.Timer(delay, self._background_refresh)
+        self._refresh_timer.daemon = True
+        self._refresh_timer.start()
+    
+    def _background_refresh(self):
+        """Refresh credentials from the scheduler thread and reschedule."""
+        try:
+            with self._refresh_lock:
+                if not self.credentials:
+                    return
+                self.credentials.refresh(self._get_transport())
+                self._update_valid_until()
+        except Exception:
+            # Retry quietly (a warning would land over the active prompt). Until a
+            # retry succeeds, the Gmail client's AuthorizedHttp refreshes on demand.
+            if self.credentials:
+                self._cancel_refresh()
+                delay = min(self.REFRESH_RETRY_MAX_SECONDS,
+                            self.REFRESH_RETRY_SECONDS * 2 ** self._refresh_failures)
+                self._refresh_failures += 1
+                self._start_refresh_timer(delay)
+            return
+        
+        self._refresh_failures = 0
+        self._schedule_refresh()
+    
+    def _cancel_refresh(self):
+        """Cancel any pending background refresh."""
+        if self._refresh_timer:
+            self._refresh_timer.cancel()
+            self._refresh_timer = None
+    
     def cleanup(self):
         """
         Clean up credentials from memory.
         Called on application exit for security.
         """
+        self._cancel_refresh()
+        if self._transport:
+            self._transport.session.close()
+            self._transport = None
         if self.credentials:
             print(f"{Fore.YELLOW}🧹 Cleaning up OAuth credentials...{Style.RESET_ALL}")
             self.credentials = None
+            self._valid_until_ts = 0.0
+            self._valid_until_expiry = None
             print(f"{Fore.GREEN}✅ Credentials cleaned from memory{Style.RESET_ALL}")
     
     def get_user_info(self) -> Dict[str, Any]:
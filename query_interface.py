@@ -4,13 +4,37 @@ Provides CLI for natural language email analysis queries.
 """
 
 import sys
-from typing import List, Dict, Any, Optional
-from colorama import Fore, Style, init
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Tuple
+from terminal_colors import Fore, Style, input_prompt
 from gmail_client import GmailClient
 from llm_client import LLMClient
 
-# Initialize colorama
-init(autoreset=True)
+try:
+    # Line editing and history for input() where available (not on Windows);
+    # colored prompts go through input_prompt() so readline measures them correctly
+    import readline  # noqa: F401
+except ImportError:
+    pass
+
+# Static UI strings, composed once at import
+_HEADER_SEP = Fore.CYAN + '=' * 60 + Style.RESET_ALL
+_RESULT_SEP = Fore.GREEN + '=' * 60 + Style.RESET_ALL
+
+_MENU = "\n".join([
+    f"\n{Fore.CYAN}📋 What would you like to do?{Style.RESET_ALL}",
+    f"{Fore.WHITE}1. 🤖 Ask custom question about your emails{Style.RESET_ALL}",
+    f"{Fore.WHITE}2. 📅 Analyze recent emails (last 30 days){Style.RESET_ALL}",
+    f"{Fore.WHITE}3. 🔍 Search emails and analyze{Style.RESET_ALL}",
+    f"{Fore.WHITE}4. 📊 Extract specific content (travel, receipts, etc.){Style.RESET_ALL}",
+    f"{Fore.WHITE}5. 📈 Analyze communication patterns{Style.RESET_ALL}",
+    f"{Fore.WHITE}6. 📋 Show email statistics{Style.RESET_ALL}",
+    f"{Fore.WHITE}7. 🔄 Reload email data{Style.RESET_ALL}",
+    f"{Fore.WHITE}8. 🚪 Exit{Style.RESET_ALL}",
+])
+_VALID_CHOICES = frozenset({'1', '2', '3', '4', '5', '6', '7', '8'})
+_PROMPT = input_prompt(f"\n{Fore.YELLOW}Enter your choice (1-8, ? for menu): {Style.RESET_ALL}")
 
 class QueryInterface:
     """Interactive command-line interface for email analysis queries."""
@@ -20,61 +44,103 @@ class QueryInterface:
         self.gmail_client = gmail_client
         self.llm_client = llm_client
         self.current_emails = []
+        self.current_format = 'full'
         self.last_query = ""
+        # Runs Gmail fetches while the user is still typing
+        self._executor = ThreadPoolExecutor(max_workers=2)
+        # (days, max_results, fetch_format) -> (fetched_at, emails)
+        self._email_cache: Dict[Tuple[int, int, str], Tuple[float, List[Dict[str, Any]]]] = {}
+        
+        # Menu choice -> handler
+        self._dispatch = {
+            '1': self._custom_query,
+            '2': self._recent_emails_analysis,
+            '3': self._search_and_analyze,
+            '4': self._extract_content_types,
+            '5': self._analyze_patterns,
+            '6': self._email_statistics,
+            '7': self._reload_data,
+            '8': self._exit,
+        }
         
     def start(self):
         """Start the interactive query interface."""
-        print(f"\n{Fore.CYAN}{'='*60}{Style.RESET_ALL}")
+        print("\n" + _HEADER_SEP)
         print(f"{Fore.CYAN}🤖 GmailWithLLM - Interactive Email Analysis{Style.RESET_ALL}")
-        print(f"{Fore.CYAN}{'='*60}{Style.RESET_ALL}")
+        print(_HEADER_SEP)
         print(f"{Fore.GREEN}✅ Connected to Gmail: {self.gmail_client.user_email}{Style.RESET_ALL}")
         print(f"{Fore.GREEN}✅ LLM client ready for analysis{Style.RESET_ALL}")
         
+        show_menu = True
         while True:
             try:
-                self._show_menu()
-                choice = input(f"\n{Fore.YELLOW}Enter your choice (1-8): {Style.RESET_ALL}").strip()
+                # Only redraw the menu after an action or on request
+                if show_menu:
+                    self._show_menu()
+                    show_menu = False
+                choice = input(_PROMPT).strip()
                 
-                if choice == '1':
-                    self._custom_query()
-                elif choice == '2':
-                    self._recent_emails_analysis()
-                elif choice == '3':
-                    self._search_and_analyze()
-                elif choice == '4':
-                    self._extract_content_types()
-                elif choice == '5':
-                    self._analyze_patterns()
-                elif choice == '6':
-                    self._email_statistics()
-                elif choice == '7':
-                    self._reload_data()
-                elif choice == '8':
-                    self._exit()
-                    break
-                else:
+                if choice == '?':
+                    show_menu = True
+                    continue
+                
+                if choice not in _VALID_CHOICES:
                     print(f"{Fore.RED}❌ Invalid choice. Please enter 1-8.{Style.RESET_ALL}")
+                    continue
+                
+                self._dispatch[choice]()
+                if choice == '8':
+                    break
+                
+                show_menu = True
                     
-            except KeyboardInterrupt:
+            except (KeyboardInterrupt, EOFError):
+                # Ctrl-C, Ctrl-D or closed stdin: input() would fail on every retry
                 print(f"\n{Fore.YELLOW}👋 Goodbye!{Style.RESET_ALL}")
                 break
             except Exception as e:
                 print(f"{Fore.RED}❌ Error: {str(e)}{Style.RESET_ALL}")
+                show_menu = True
+    
+    def _write_block(self, lines: List[str]):
+        """Write several output lines with a single stdout write and flush."""
+        sys.stdout.write("\n".join(lines) + "\n")
+        sys.stdout.flush()
+    
+    def _print_result(self, title: str, result: str):
+        """Print an analysis result under a banner in a single write."""
+        self._write_block(["", _RESULT_SEP, f"{Fore.GREEN}{title}{Style.RESET_ALL}", _RESULT_SEP, str(result)])
+    
+    def _stream_analysis(self, title: str, emails: List[Dict[str, Any]], query: str):
+        """Stream an LLM analysis under a result banner as it is generated."""
+        self._write_block(["", _RESULT_SEP, f"{Fore.GREEN}{title}{Style.RESET_ALL}", _RESULT_SEP])
+        
+        streamed = []
+        
+        def _on_delta(text: str):
+            streamed.append(text)
+            sys.stdout.write(text)
+            sys.stdout.flush()
+        
+        result = self.llm_client.stream_analysis(emails, query, on_delta=_on_delta)
+        
+        # Errors (including ones raised mid-stream) are returned rather than streamed
+        if result != ''.join(streamed):
+            if streamed:
+                sys.stdout.write("\n")
+            sys.stdout.write(result)
+        sys.stdout.write("\n")
+        sys.stdout.flush()
     
     def _show_menu(self):
         """Display the main menu options."""
-        print(f"\n{Fore.CYAN}📋 What would you like to do?{Style.RESET_ALL}")
-        print(f"{Fore.WHITE}1. 🤖 Ask custom question about your emails{Style.RESET_ALL}")
-        print(f"{Fore.WHITE}2. 📅 Analyze recent emails (last 30 days){Style.RESET_ALL}")
-        print(f"{Fore.WHITE}3. 🔍 Search emails and analyze{Style.RESET_ALL}")
-        print(f"{Fore.WHITE}4. 📊 Extract specific content (travel, receipts, etc.){Style.RESET_ALL}")
-        print(f"{Fore.WHITE}5. 📈 Analyze communication patterns{Style.RESET_ALL}")
-        print(f"{Fore.WHITE}6. 📋 Show email statistics{Style.RESET_ALL}")
-        print(f"{Fore.WHITE}7. 🔄 Reload email data{Style.RESET_ALL}")
-        print(f"{Fore.WHITE}8. 🚪 Exit{Style.RESET_ALL}")
+        print(_MENU)
     
     def _custom_query(self):
         """Handle custom user queries about email data."""
+        # If no emails loaded, start loading recent emails while the user types
+        preload = self._preload_recent_emails(days=90, max_results=100)
+        
         print(f"\n{Fore.CYAN}🤖 Custom Email Analysis{Style.RESET_ALL}")
         print(f"{Fore.YELLOW}💡 Example queries:{Style.RESET_ALL}")
         print("   • Find all my travel confirmations from 2024")
@@ -82,29 +148,24 @@ class QueryInterface:
         print("   • Show me patterns in my work emails")
         print("   • What are my most important unread emails?")
         
-        query = input(f"\n{Fore.CYAN}Your question: {Style.RESET_ALL}").strip()
+        query = input(input_prompt(f"\n{Fore.CYAN}Your question: {Style.RESET_ALL}")).strip()
         
         if not query:
             print(f"{Fore.RED}❌ Please enter a question.{Style.RESET_ALL}")
             return
         
-        # If no emails loaded, get recent emails
-        if not self.current_emails:
-            print(f"{Fore.YELLOW}📧 Loading recent emails for analysis...{Style.RESET_ALL}")
-            self.current_emails = self.gmail_client.get_recent_emails(days=90, max_results=100)
+        self._finish_preload(preload)
         
         if not self.current_emails:
             print(f"{Fore.RED}❌ No emails found for analysis.{Style.RESET_ALL}")
             return
         
+        # Custom questions may depend on message bodies
+        self._ensure_full_emails()
+        
         # Analyze with LLM
         print(f"\n{Fore.CYAN}🤖 Analyzing {len(self.current_emails)} emails...{Style.RESET_ALL}")
-        result = self.llm_client.analyze_emails(self.current_emails, query)
-        
-        print(f"\n{Fore.GREEN}{'='*60}{Style.RESET_ALL}")
-        print(f"{Fore.GREEN}📊 Analysis Results{Style.RESET_ALL}")
-        print(f"{Fore.GREEN}{'='*60}{Style.RESET_ALL}")
-        print(result)
+        self._stream_analysis("📊 Analysis Results", self.current_emails, query)
         
         self.last_query = query
     
@@ -112,20 +173,21 @@ class QueryInterface:
         """Analyze recent emails."""
         print(f"\n{Fore.CYAN}📅 Recent Email Analysis{Style.RESET_ALL}")
         
-        days = input(f"{Fore.YELLOW}How many days back? (default 30): {Style.RESET_ALL}").strip()
+        days = input(input_prompt(f"{Fore.YELLOW}How many days back? (default 30): {Style.RESET_ALL}")).strip()
         try:
             days = int(days) if days else 30
         except ValueError:
             days = 30
         
-        max_emails = input(f"{Fore.YELLOW}Max emails to analyze? (default 50): {Style.RESET_ALL}").strip()
+        max_emails = input(input_prompt(f"{Fore.YELLOW}Max emails to analyze? (default 50): {Style.RESET_ALL}")).strip()
         try:
             max_emails = int(max_emails) if max_emails else 50
         except ValueError:
             max_emails = 50
         
         print(f"{Fore.CYAN}📧 Fetching emails from last {days} days...{Style.RESET_ALL}")
-        self.current_emails = self.gmail_client.get_recent_emails(days=days, max_results=max_emails)
+        # A summary only needs headers and snippets
+        self._load_recent_emails(days=days, max_results=max_emails, fetch_format='metadata')
         
         if not self.current_emails:
             print(f"{Fore.RED}❌ No emails found in the specified period.{Style.RESET_ALL}")
@@ -134,10 +196,7 @@ class QueryInterface:
         # Generate summary
         result = self.llm_client.summarize_emails(self.current_emails)
         
-        print(f"\n{Fore.GREEN}{'='*60}{Style.RESET_ALL}")
-        print(f"{Fore.GREEN}📊 Recent Email Summary ({len(self.current_emails)} emails){Style.RESET_ALL}")
-        print(f"{Fore.GREEN}{'='*60}{Style.RESET_ALL}")
-        print(result)
+        self._print_result(f"📊 Recent Email Summary ({len(self.current_emails)} emails)", result)
     
     def _search_and_analyze(self):
         """Search for specific emails and analyze them."""
@@ -148,41 +207,47 @@ class QueryInterface:
         print("   • travel OR flight OR hotel")
         print("   • has:attachment")
         
-        query = input(f"\n{Fore.CYAN}Search query: {Style.RESET_ALL}").strip()
+        query = input(input_prompt(f"\n{Fore.CYAN}Search query: {Style.RESET_ALL}")).strip()
         
         if not query:
             print(f"{Fore.RED}❌ Please enter a search query.{Style.RESET_ALL}")
             return
         
-        max_results = input(f"{Fore.YELLOW}Max results? (default 50): {Style.RESET_ALL}").strip()
+        max_results = input(input_prompt(f"{Fore.YELLOW}Max results? (default 50): {Style.RESET_ALL}")).strip()
         try:
             max_results = int(max_results) if max_results else 50
         except ValueError:
             max_results = 50
         
-        # Search emails
-        self.current_emails = self.gmail_client.search_emails(query, max_results=max_results)
-        
-        if not self.current_emails:
-            print(f"{Fore.RED}❌ No emails found matching your search.{Style.RESET_ALL}")
-            return
+        # Search emails in the background while the user types the question
+        search = self._executor.submit(
+            self.gmail_client.search_emails, query, max_results=max_results, quiet=True
+        )
         
         # Ask for analysis type
-        analysis_query = input(f"\n{Fore.CYAN}What would you like to know about these {len(self.current_emails)} emails? {Style.RESET_ALL}").strip()
+        analysis_query = input(input_prompt(f"\n{Fore.CYAN}What would you like to know about these emails? {Style.RESET_ALL}")).strip()
         
         if not analysis_query:
             analysis_query = "Please summarize these emails and provide key insights."
         
-        # Analyze with LLM
-        result = self.llm_client.analyze_emails(self.current_emails, analysis_query)
+        print(f"{Fore.CYAN}🔍 Searching emails...{Style.RESET_ALL}")
+        self.current_emails = search.result()
+        self.current_format = 'full'
         
-        print(f"\n{Fore.GREEN}{'='*60}{Style.RESET_ALL}")
-        print(f"{Fore.GREEN}📊 Search Results Analysis{Style.RESET_ALL}")
-        print(f"{Fore.GREEN}{'='*60}{Style.RESET_ALL}")
-        print(result)
+        if not self.current_emails:
+            print(f"{Fore.RED}❌ No emails found matching your search.{Style.RESET_ALL}")
+            return
+        
+        print(f"{Fore.GREEN}✅ Found {len(self.current_emails)} emails{Style.RESET_ALL}")
+        
+        # Analyze with LLM
+        self._stream_analysis("📊 Search Results Analysis", self.current_emails, analysis_query)
     
     def _extract_content_types(self):
         """Extract specific content types from emails."""
+        # If no emails loaded, start loading recent emails while the user chooses
+        preload = self._preload_recent_emails(days=365, max_results=200)
+        
         print(f"\n{Fore.CYAN}📊 Extract Specific Content{Style.RESET_ALL}")
         print(f"{Fore.YELLOW}💡 Content types:{Style.RESET_ALL}")
         print("   1. Travel confirmations and itineraries")
@@ -192,7 +257,7 @@ class QueryInterface:
         print("   5. Work-related action items")
         print("   6. Custom content type")
         
-        choice = input(f"\n{Fore.CYAN}Choose content type (1-6): {Style.RESET_ALL}").strip()
+        choice = input(input_prompt(f"\n{Fore.CYAN}Choose content type (1-6): {Style.RESET_ALL}")).strip()
         
         content_types = {
             '1': 'travel confirmations, flight bookings, hotel reservations, and itineraries',
@@ -205,7 +270,7 @@ class QueryInterface:
         if choice in content_types:
             content_type = content_types[choice]
         elif choice == '6':
-            content_type = input(f"{Fore.CYAN}Enter custom content type: {Style.RESET_ALL}").strip()
+            content_type = input(input_prompt(f"{Fore.CYAN}Enter custom content type: {Style.RESET_ALL}")).strip()
             if not content_type:
                 print(f"{Fore.RED}❌ Please specify a content type.{Style.RESET_ALL}")
                 return
@@ -213,22 +278,19 @@ class QueryInterface:
             print(f"{Fore.RED}❌ Invalid choice.{Style.RESET_ALL}")
             return
         
-        # If no emails loaded, get recent emails
-        if not self.current_emails:
-            print(f"{Fore.YELLOW}📧 Loading recent emails for analysis...{Style.RESET_ALL}")
-            self.current_emails = self.gmail_client.get_recent_emails(days=365, max_results=200)
+        self._finish_preload(preload)
         
         if not self.current_emails:
             print(f"{Fore.RED}❌ No emails found for analysis.{Style.RESET_ALL}")
             return
         
+        # Content extraction reads message bodies
+        self._ensure_full_emails()
+        
         # Extract content
         result = self.llm_client.extract_content_type(self.current_emails, content_type)
         
-        print(f"\n{Fore.GREEN}{'='*60}{Style.RESET_ALL}")
-        print(f"{Fore.GREEN}📊 Extracted: {content_type.title()}{Style.RESET_ALL}")
-        print(f"{Fore.GREEN}{'='*60}{Style.RESET_ALL}")
-        print(result)
+        self._print_result(f"📊 Extracted: {content_type.title()}", result)
     
     def _analyze_patterns(self):
         """Analyze communication patterns."""
@@ -237,7 +299,7 @@ class QueryInterface:
         # If no emails loaded, get recent emails
         if not self.current_emails:
             print(f"{Fore.YELLOW}📧 Loading recent emails for pattern analysis...{Style.RESET_ALL}")
-            self.current_emails = self.gmail_client.get_recent_emails(days=90, max_results=150)
+            self._load_recent_emails(days=90, max_results=150, fetch_format='metadata')
         
         if not self.current_emails:
             print(f"{Fore.RED}❌ No emails found for analysis.{Style.RESET_ALL}")
@@ -246,10 +308,7 @@ class QueryInterface:
         # Analyze patterns
         result = self.llm_client.find_patterns(self.current_emails)
         
-        print(f"\n{Fore.GREEN}{'='*60}{Style.RESET_ALL}")
-        print(f"{Fore.GREEN}📊 Communication Patterns ({len(self.current_emails)} emails){Style.RESET_ALL}")
-        print(f"{Fore.GREEN}{'='*60}{Style.RESET_ALL}")
-        print(result)
+        self._print_result(f"📊 Communication Patterns ({len(self.current_emails)} emails)", result)
     
     def _email_statistics(self):
         """Show basic email statistics."""
@@ -258,7 +317,7 @@ class QueryInterface:
         # If no emails loaded, get recent emails
         if not self.current_emails:
             print(f"{Fore.YELLOW}📧 Loading recent emails for statistics...{Style.RESET_ALL}")
-            self.current_emails = self.gmail_client.get_recent_emails(days=30, max_results=100)
+            self._load_recent_emails(days=30, max_results=100, fetch_format='metadata')
         
         if not self.current_emails:
             print(f"{Fore.RED}❌ No emails found for statistics.{Style.RESET_ALL}")
@@ -267,26 +326,95 @@ class QueryInterface:
         # Generate statistics
         stats = self.gmail_client.get_email_statistics(self.current_emails)
         
-        print(f"\n{Fore.GREEN}{'='*60}{Style.RESET_ALL}")
-        print(f"{Fore.GREEN}📊 Email Statistics{Style.RESET_ALL}")
-        print(f"{Fore.GREEN}{'='*60}{Style.RESET_ALL}")
-        
-        print(f"{Fore.CYAN}📧 Total emails analyzed: {stats.get('total_emails', 0)}{Style.RESET_ALL}")
-        print(f"{Fore.CYAN}👥 Unique senders: {stats.get('unique_senders', 0)}{Style.RESET_ALL}")
+        lines = [
+            "",
+            _RESULT_SEP,
+            f"{Fore.GREEN}📊 Email Statistics{Style.RESET_ALL}",
+            _RESULT_SEP,
+            f"{Fore.CYAN}📧 Total emails analyzed: {stats.get('total_emails', 0)}{Style.RESET_ALL}",
+            f"{Fore.CYAN}👥 Unique senders: {stats.get('unique_senders', 0)}{Style.RESET_ALL}",
+        ]
         
         if 'date_range' in stats:
             date_range = stats['date_range']
-            print(f"{Fore.CYAN}📅 Date range: {date_range.get('earliest', 'N/A')} to {date_range.get('latest', 'N/A')}{Style.RESET_ALL}")
+            lines.append(f"{Fore.CYAN}📅 Date range: {date_range.get('earliest', 'N/A')} to {date_range.get('latest', 'N/A')}{Style.RESET_ALL}")
         
         if 'top_senders' in stats:
-            print(f"\n{Fore.YELLOW}🏆 Top Senders:{Style.RESET_ALL}")
-            for i, (sender, count) in enumerate(stats['top_senders'][:10], 1):
-                print(f"   {i}. {sender}: {count} emails")
+            lines.append(f"\n{Fore.YELLOW}🏆 Top Senders:{Style.RESET_ALL}")
+            lines.extend(
+                f"   {i}. {sender}: {count} emails"
+                for i, (sender, count) in enumerate(stats['top_senders'][:10], 1)
+            )
+        
+        self._write_block(lines)
+    
+    def _load_recent_emails(self, days: int, max_results: int, fetch_format: str = 'full'):
+        """Load recent emails into the current working set."""
+        self.current_emails = self._get_recent_cached(days, max_results, fetch_format)
+        self.current_format = fetch_format
+    
+    def _preload_recent_emails(self, days: int, max_results: int,
+                               fetch_format: str = 'full') -> Optional[Tuple[Future, str]]:
+        """
+        Start loading recent emails in the background if none are loaded.
+        Returns the pending load with the format it fetches, for _finish_preload.
+        """
+        if self.current_emails:
+            return None
+        
+        # Quiet: progress output would overwrite the line the user is typing
+        future = self._executor.submit(self._get_recent_cached, days, max_results, fetch_format,
+                                       quiet=True)
+        return future, fetch_format
+    
+    def _finish_preload(self, preload: Optional[Tuple[Future, str]]):
+        """Wait for a background load started by _preload_recent_emails."""
+        if preload is None:
+            return
+        
+        future, fetch_format = preload
+        print(f"{Fore.YELLOW}📧 Loading recent emails for analysis...{Style.RESET_ALL}")
+        self.current_emails = future.result()
+        self.current_format = fetch_format
+        if self.current_emails:
+            print(f"{Fore.GREEN}✅ Loaded {len(self.current_emails)} emails{Style.RESET_ALL}")
+    
+    def _get_recent_cached(self, days: int, max_results: int, fetch_format: str = 'full',
+                           ttl: float = 300, quiet: bool = False) -> List[Dict[str, Any]]:
+        """Get recent emails, reusing a fetch of the same window younger than ttl seconds."""
+        key = (days, max_results, fetch_format)
+        cached = self._email_cache.get(key)
+        if cached is not None and time.monotonic() - cached[0] < ttl:
+            return cached[1]
+        
+        emails = self.gmail_client.get_recent_emails(
+            days=days,
+            max_results=max_results,
+            fetch_format=fetch_format,
+            quiet=quiet
+        )
+        if emails:
+            self._email_cache[key] = (time.monotonic(), emails)
+        return emails
+    
+    def _ensure_full_emails(self):
+        """Upgrade metadata-only emails to full messages before deep analysis."""
+        if self.current_emails and self.current_format != 'full':
+            self.current_emails = self.gmail_client.fetch_full_emails(self.current_emails)
+            self.current_format = 'full'
     
     def _reload_data(self):
-        """Reload email data."""
+        """
+        Reload email data.
+        Only cached email data is dropped; the authenticated Gmail client and
+        its API resource and HTTP connections are kept for the next fetch.
+        """
         print(f"\n{Fore.CYAN}🔄 Reload Email Data{Style.RESET_ALL}")
         self.current_emails = []
+        self.current_format = 'full'
+        self.last_query = ""
+        self._email_cache.clear()
+        self.gmail_client.clear_cache()
         print(f"{Fore.GREEN}✅ Email data cleared. It will be reloaded on next analysis.{Style.RESET_ALL}")
     
     def _exit(self):
@@ -296,5 +424,8 @@ class QueryInterface:
     
     def cleanup(self):
         """Clean up query interface resources."""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._email_cache.clear()
         self.current_emails = []
+        self.current_format = 'full'
         self.last_query = ""
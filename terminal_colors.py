@@ -0,0 +1,42 @@
+"""
+Terminal color support for GmailWithLLM.
+Sets up colorama once and disables ANSI styling when output is not a TTY.
+"""
+
+import re
+import sys
+
+# ANSI SGR sequences as emitted by Fore/Style
+_ANSI_RE = re.compile(r'(\x1b\[[0-9;]*m)')
+
+
+class _NoColor:
+    """Stand-in for colorama's Fore/Style that renders every attribute as ''."""
+    
+    def __getattr__(self, name: str) -> str:
+        return ''
+
+
+if sys.stdout.isatty():
+    from colorama import Fore, Style
+    
+    # Only Windows consoles need colorama to wrap stdout and translate ANSI;
+    # POSIX terminals render the escape codes natively
+    if sys.platform == 'win32':
+        from colorama import init
+        init(autoreset=True)
+else:
+    # Piped or redirected output: emit plain text
+    Fore = Style = _NoColor()
+
+
+def input_prompt(text: str) -> str:
+    """
+    Prepare a colored prompt for input().
+    With GNU readline loaded, escape codes must be marked zero-width
+    (\\001...\\002) or readline miscounts the prompt width and misplaces
+    the cursor on wrapping, Ctrl-A/Ctrl-E and history recall.
+    """
+    if 'readline' not in sys.modules:
+        return text
+    return _ANSI_RE.sub('\x01\\1\x02', text)